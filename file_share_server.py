@@ -46,8 +46,12 @@ def load_sessions() -> Dict:
 
 
 def save_sessions(sessions: Dict):
-    with open(SESSION_FILE, 'w') as f:
-        json.dump(sessions, f, indent=2)
+    tmp = f"{SESSION_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(sessions, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, SESSION_FILE)
 
 
 def cleanup_expired_sessions():
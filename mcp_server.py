@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 """MCP Server for document operations (docx, xlsx, pdf, txt, csv)"""
 
+import csv
+import fnmatch
+import glob
+import io
 import json
 import os
-from typing import Optional, List, Any, Dict
+import stat
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Optional, List, Any, Awaitable, Callable, Dict, Tuple
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 import mcp.types as types
@@ -16,341 +23,490 @@ import pandas as pd
 
 app = Server("doc-tools")
 
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_P, _W_R, _W_T = _W + "p", _W + "r", _W + "t"
+_W_TAB, _W_BR, _W_CR = _W + "tab", _W + "br", _W + "cr"
+_W_TBL, _W_TR, _W_TC = _W + "tbl", _W + "tr", _W + "tc"
+_W_HYPERLINK = _W + "hyperlink"
+_W_TCPR, _W_GRIDSPAN, _W_VMERGE = _W + "tcPr", _W + "gridSpan", _W + "vMerge"
+_W_VAL = _W + "val"
+
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB
+
 
 def _validate_path(path: str) -> str:
+    return _stat_path(path)[0]
+
+
+def _stat_path(path: str) -> Tuple[str, os.stat_result]:
     abs_path = os.path.abspath(path)
-    if not os.path.exists(abs_path):
-        raise FileNotFoundError(f"File not found: {abs_path}")
-    return abs_path
+    try:
+        st = os.stat(abs_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File not found: {abs_path}") from None
+    return abs_path, st
+
+
+def _ensure_dir(path: str) -> None:
+    # Not cached: a folder can be deleted between calls, and makedirs on an
+    # existing directory costs only a couple of syscalls
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+
+_TOOLS = [
+    types.Tool(
+        name="read_txt",
+        description="Read a text file and return its contents",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the text file"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="read_csv",
+        description="Read a CSV file and return its contents as JSON",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the CSV file"},
+                "delimiter": {"type": "string", "default": ",", "description": "CSV delimiter"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="read_docx",
+        description="Read a Word document and return its text content",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the .docx file"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="read_xlsx",
+        description="Read an Excel file and return its contents as JSON (all sheets)",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the .xlsx file"},
+                "sheet": {"type": "string", "description": "Specific sheet name (optional, returns all if not specified)"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="read_pdf",
+        description="Read a PDF file and return its text content",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the PDF file"},
+                "pages": {"type": "string", "description": "Page range (e.g., '1-5' or '1,3,5'), optional"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="create_txt",
+        description="Create a text file with the given content",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path for the new text file"},
+                "content": {"type": "string", "description": "Content to write"}
+            },
+            "required": ["path", "content"]
+        }
+    ),
+    types.Tool(
+        name="create_csv",
+        description="Create a CSV file from JSON data",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path for the new CSV file"},
+                "data": {"type": "string", "description": "JSON array of objects to write as CSV"},
+                "delimiter": {"type": "string", "default": ",", "description": "CSV delimiter"}
+            },
+            "required": ["path", "data"]
+        }
+    ),
+    types.Tool(
+        name="create_docx",
+        description="Create a Word document with text content",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path for the new .docx file"},
+                "content": {"type": "string", "description": "Text content (use \\n for paragraphs)"}
+            },
+            "required": ["path", "content"]
+        }
+    ),
+    types.Tool(
+        name="create_xlsx",
+        description="Create an Excel file from JSON data",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path for the new .xlsx file"},
+                "sheets": {"type": "string", "description": "JSON object: {\"SheetName\": [[row1], [row2], ...] or [{col: val}, ...]}"},
+                "headers": {"type": "boolean", "default": True, "description": "First row is header (for object data)"}
+            },
+            "required": ["path", "sheets"]
+        }
+    ),
+    types.Tool(
+        name="append_to_txt",
+        description="Append content to an existing text file",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the text file"},
+                "content": {"type": "string", "description": "Content to append"}
+            },
+            "required": ["path", "content"]
+        }
+    ),
+    types.Tool(
+        name="append_to_csv",
+        description="Append rows to an existing CSV file",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to the CSV file"},
+                "data": {"type": "string", "description": "JSON array of objects to append"}
+            },
+            "required": ["path", "data"]
+        }
+    ),
+    types.Tool(
+        name="list_directory",
+        description="List files in a directory",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Directory path"},
+                "pattern": {"type": "string", "description": "File pattern filter (e.g., '*.txt'), optional"}
+            },
+            "required": ["path"]
+        }
+    ),
+    types.Tool(
+        name="get_file_info",
+        description="Get file metadata (size, modified time, etc.)",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "Path to file"}
+            },
+            "required": ["path"]
+        }
+    )
+]
 
 
 @app.list_tools()
 async def list_tools() -> List[types.Tool]:
-    return [
-        types.Tool(
-            name="read_txt",
-            description="Read a text file and return its contents",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the text file"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="read_csv",
-            description="Read a CSV file and return its contents as JSON",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the CSV file"},
-                    "delimiter": {"type": "string", "default": ",", "description": "CSV delimiter"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="read_docx",
-            description="Read a Word document and return its text content",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the .docx file"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="read_xlsx",
-            description="Read an Excel file and return its contents as JSON (all sheets)",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the .xlsx file"},
-                    "sheet": {"type": "string", "description": "Specific sheet name (optional, returns all if not specified)"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="read_pdf",
-            description="Read a PDF file and return its text content",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the PDF file"},
-                    "pages": {"type": "string", "description": "Page range (e.g., '1-5' or '1,3,5'), optional"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="create_txt",
-            description="Create a text file with the given content",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path for the new text file"},
-                    "content": {"type": "string", "description": "Content to write"}
-                },
-                "required": ["path", "content"]
-            }
-        ),
-        types.Tool(
-            name="create_csv",
-            description="Create a CSV file from JSON data",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path for the new CSV file"},
-                    "data": {"type": "string", "description": "JSON array of objects to write as CSV"},
-                    "delimiter": {"type": "string", "default": ",", "description": "CSV delimiter"}
-                },
-                "required": ["path", "data"]
-            }
-        ),
-        types.Tool(
-            name="create_docx",
-            description="Create a Word document with text content",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path for the new .docx file"},
-                    "content": {"type": "string", "description": "Text content (use \\n for paragraphs)"}
-                },
-                "required": ["path", "content"]
-            }
-        ),
-        types.Tool(
-            name="create_xlsx",
-            description="Create an Excel file from JSON data",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path for the new .xlsx file"},
-                    "sheets": {"type": "string", "description": "JSON object: {\"SheetName\": [[row1], [row2], ...] or [{col: val}, ...]}"},
-                    "headers": {"type": "boolean", "default": True, "description": "First row is header (for object data)"}
-                },
-                "required": ["path", "sheets"]
-            }
-        ),
-        types.Tool(
-            name="append_to_txt",
-            description="Append content to an existing text file",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the text file"},
-                    "content": {"type": "string", "description": "Content to append"}
-                },
-                "required": ["path", "content"]
-            }
-        ),
-        types.Tool(
-            name="append_to_csv",
-            description="Append rows to an existing CSV file",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to the CSV file"},
-                    "data": {"type": "string", "description": "JSON array of objects to append"}
-                },
-                "required": ["path", "data"]
-            }
-        ),
-        types.Tool(
-            name="list_directory",
-            description="List files in a directory",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Directory path"},
-                    "pattern": {"type": "string", "description": "File pattern filter (e.g., '*.txt'), optional"}
-                },
-                "required": ["path"]
-            }
-        ),
-        types.Tool(
-            name="get_file_info",
-            description="Get file metadata (size, modified time, etc.)",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "path": {"type": "string", "description": "Path to file"}
-                },
-                "required": ["path"]
-            }
-        )
-    ]
+    return _TOOLS
+
+
+async def _handle_read_txt(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return [types.TextContent(type="text", text=content)]
+
+
+async def _handle_read_csv(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    delimiter = arguments.get("delimiter", ",")
+    df = pd.read_csv(path, delimiter=delimiter)
+    result = df.to_json(orient='records', force_ascii=False)
+    return [types.TextContent(type="text", text=result)]
+
+
+async def _handle_read_docx(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    return [types.TextContent(type="text", text=_read_docx_text(path))]
+
+
+async def _handle_read_xlsx(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    sheet_name = arguments.get("sheet")
+    wb = load_workbook(path, data_only=True)
+    
+    result = {}
+    sheets_to_read = [sheet_name] if sheet_name else wb.sheetnames
+    
+    for sheet in sheets_to_read:
+        if sheet not in wb.sheetnames:
+            continue
+        ws = wb[sheet]
+        data = []
+        for row in ws.iter_rows(values_only=True):
+            data.append([str(cell) if cell is not None else "" for cell in row])
+        result[sheet] = data
+    
+    return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+
+
+async def _handle_read_pdf(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    pages_str = arguments.get("pages")
+    
+    text_content = []
+    with pdfplumber.open(path) as pdf:
+        if pages_str:
+            pages = _parse_page_range(pages_str, len(pdf.pages))
+        else:
+            pages = range(len(pdf.pages))
+        
+        for i in pages:
+            page = pdf.pages[i]
+            text = page.extract_text() or ""
+            text_content.append(f"--- Page {i+1} ---\n{text}")
+    
+    return [types.TextContent(type="text", text="\n\n".join(text_content))]
+
+
+async def _handle_create_txt(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    content = arguments["content"]
+    _ensure_dir(path)
+    with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(content)
+    return [types.TextContent(type="text", text=f"Created: {path}")]
+
+
+async def _handle_create_csv(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    data = json.loads(arguments["data"])
+    delimiter = arguments.get("delimiter", ",")
+    _ensure_dir(path)
+    with open(path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=_csv_fieldnames(data), delimiter=delimiter, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(data)
+    return [types.TextContent(type="text", text=f"Created: {path} ({len(data)} rows)")]
+
+
+async def _handle_create_docx(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    content = arguments["content"]
+    _ensure_dir(path)
+    doc = Document()
+    paragraphs = content.split('\n')
+    for para in paragraphs:
+        if para.strip():
+            doc.add_paragraph(para)
+    doc.save(path)
+    return [types.TextContent(type="text", text=f"Created: {path}")]
+
+
+async def _handle_create_xlsx(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    sheets_data = json.loads(arguments["sheets"])
+    use_headers = arguments.get("headers", True)
+    _ensure_dir(path)
+    
+    # write_only streams rows straight to XML; it has no default active sheet
+    wb = Workbook(write_only=True)
+    if not sheets_data:
+        wb.create_sheet("Sheet")
+    
+    for sheet_name, data in sheets_data.items():
+        ws = wb.create_sheet(sheet_name)
+        
+        if data and isinstance(data[0], dict):
+            headers = list(data[0].keys())
+            if use_headers:
+                ws.append(headers)
+            for row_data in data:
+                ws.append([row_data.get(h, "") for h in headers])
+        else:
+            for row in data:
+                ws.append(row)
+    
+    wb.save(path)
+    return [types.TextContent(type="text", text=f"Created: {path}")]
+
+
+async def _handle_append_to_txt(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    content = arguments["content"]
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("\n" + content)
+    return [types.TextContent(type="text", text=f"Appended to: {path}")]
+
+
+async def _handle_append_to_csv(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = _validate_path(arguments["path"])
+    data = json.loads(arguments["data"])
+    with open(path, 'a', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=_csv_fieldnames(data), lineterminator='\n')
+        writer.writerows(data)
+    return [types.TextContent(type="text", text=f"Appended {len(data)} rows to: {path}")]
+
+
+async def _handle_list_directory(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path = arguments["path"]
+    pattern = arguments.get("pattern", "*")
+    if '/' in pattern or os.sep in pattern:
+        # Patterns that reach into subdirectories need the full glob walk
+        files = glob.glob(os.path.join(path, pattern))
+        result = [{"name": os.path.basename(f), "path": f, "is_dir": os.path.isdir(f)} for f in files]
+        return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+    # Like glob, hidden entries only match patterns that start with '.'
+    show_hidden = pattern.startswith('.')
+    try:
+        with os.scandir(path) as entries:
+            result = [
+                {"name": e.name, "path": e.path, "is_dir": e.is_dir()}
+                for e in entries
+                if (show_hidden or not e.name.startswith('.')) and fnmatch.fnmatch(e.name, pattern)
+            ]
+    except OSError:
+        # glob treated a missing or unreadable directory as having no matches
+        result = []
+    return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
+
+
+async def _handle_get_file_info(arguments: Dict[str, Any]) -> List[types.TextContent]:
+    path, st = _stat_path(arguments["path"])
+    info = {
+        "path": path,
+        "size": st.st_size,
+        "size_human": _human_readable_size(st.st_size),
+        "modified": st.st_mtime,
+        "is_file": stat.S_ISREG(st.st_mode),
+        "is_dir": stat.S_ISDIR(st.st_mode)
+    }
+    return [types.TextContent(type="text", text=json.dumps(info, ensure_ascii=False, indent=2))]
+
+
+_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[List[types.TextContent]]]] = {
+    "read_txt": _handle_read_txt,
+    "read_csv": _handle_read_csv,
+    "read_docx": _handle_read_docx,
+    "read_xlsx": _handle_read_xlsx,
+    "read_pdf": _handle_read_pdf,
+    "create_txt": _handle_create_txt,
+    "create_csv": _handle_create_csv,
+    "create_docx": _handle_create_docx,
+    "create_xlsx": _handle_create_xlsx,
+    "append_to_txt": _handle_append_to_txt,
+    "append_to_csv": _handle_append_to_csv,
+    "list_directory": _handle_list_directory,
+    "get_file_info": _handle_get_file_info,
+}
 
 
 @app.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
+    handler = _HANDLERS.get(name)
+    if handler is None:
+        return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
     try:
-        if name == "read_txt":
-            path = _validate_path(arguments["path"])
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            return [types.TextContent(type="text", text=content)]
-
-        elif name == "read_csv":
-            path = _validate_path(arguments["path"])
-            delimiter = arguments.get("delimiter", ",")
-            df = pd.read_csv(path, delimiter=delimiter)
-            result = df.to_json(orient='records', force_ascii=False)
-            return [types.TextContent(type="text", text=result)]
-
-        elif name == "read_docx":
-            path = _validate_path(arguments["path"])
-            doc = Document(path)
-            content = []
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    content.append(para.text)
-            for table in doc.tables:
-                content.append("\n[TABLE]")
-                for row in table.rows:
-                    row_text = " | ".join(cell.text for cell in row.cells)
-                    content.append(row_text)
-            return [types.TextContent(type="text", text="\n".join(content))]
-
-        elif name == "read_xlsx":
-            path = _validate_path(arguments["path"])
-            sheet_name = arguments.get("sheet")
-            wb = load_workbook(path, data_only=True)
-            
-            result = {}
-            sheets_to_read = [sheet_name] if sheet_name else wb.sheetnames
-            
-            for sheet in sheets_to_read:
-                if sheet not in wb.sheetnames:
-                    continue
-                ws = wb[sheet]
-                data = []
-                for row in ws.iter_rows(values_only=True):
-                    data.append([str(cell) if cell is not None else "" for cell in row])
-                result[sheet] = data
-            
-            return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
-
-        elif name == "read_pdf":
-            path = _validate_path(arguments["path"])
-            pages_str = arguments.get("pages")
-            
-            text_content = []
-            with pdfplumber.open(path) as pdf:
-                if pages_str:
-                    pages = _parse_page_range(pages_str, len(pdf.pages))
-                else:
-                    pages = range(len(pdf.pages))
-                
-                for i in pages:
-                    page = pdf.pages[i]
-                    text = page.extract_text() or ""
-                    text_content.append(f"--- Page {i+1} ---\n{text}")
-            
-            return [types.TextContent(type="text", text="\n\n".join(text_content))]
-
-        elif name == "create_txt":
-            path = arguments["path"]
-            content = arguments["content"]
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            return [types.TextContent(type="text", text=f"Created: {path}")]
-
-        elif name == "create_csv":
-            path = arguments["path"]
-            data = json.loads(arguments["data"])
-            delimiter = arguments.get("delimiter", ",")
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-            df = pd.DataFrame(data)
-            df.to_csv(path, index=False, sep=delimiter)
-            return [types.TextContent(type="text", text=f"Created: {path} ({len(data)} rows)")]
-
-        elif name == "create_docx":
-            path = arguments["path"]
-            content = arguments["content"]
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-            doc = Document()
-            paragraphs = content.split('\n')
-            for para in paragraphs:
-                if para.strip():
-                    doc.add_paragraph(para)
-            doc.save(path)
-            return [types.TextContent(type="text", text=f"Created: {path}")]
-
-        elif name == "create_xlsx":
-            path = arguments["path"]
-            sheets_data = json.loads(arguments["sheets"])
-            use_headers = arguments.get("headers", True)
-            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
-            
-            wb = Workbook()
-            first_sheet = True
-            
-            for sheet_name, data in sheets_data.items():
-                if first_sheet:
-                    ws = wb.active
-                    ws.title = sheet_name
-                    first_sheet = False
+        return await handler(arguments)
+    except Exception as e:
+        return [types.TextContent(type="text", text=f"Error: {str(e)}")]
+
+
+def _read_docx_text(path: str) -> str:
+    """Stream text out of word/document.xml without building a document model.
+
+    Output mirrors the python-docx based reader: non-blank body paragraphs
+    first, then every top-level table as a "[TABLE]" block of " | "-joined rows.
+    Like python-docx, only paragraphs directly under w:body or a top-level
+    table cell count, and only runs directly in them (or in a hyperlink), so
+    text boxes, content controls and nested tables are skipped. Merged cells
+    follow python-docx's row.cells: a cell spanning several grid columns is
+    repeated once per column, and a vertically merged continuation cell
+    repeats the cell above it.
+    """
+    body = io.StringIO()
+    tables = io.StringIO()
+    para: List[str] = []
+    cell_paras: List[str] = []
+    row_cells: List[str] = []
+    above: List[str] = []  # previous row's cells, one per grid column
+    grid_span = 1
+    v_merged = False
+    # Tags of the open elements: w:document is depth 0, w:body depth 1, body
+    # paragraphs and tables depth 2, top-level table cell paragraphs depth 5
+    stack: List[str] = []
+    para_depth = 0  # depth of the paragraph being collected, 0 if none
+    run_depth = 0  # depth of the run being collected, 0 if none
+
+    with zipfile.ZipFile(path) as z, z.open("word/document.xml") as f:
+        for event, el in ET.iterparse(f, events=("start", "end")):
+            tag = el.tag
+            if event == "start":
+                depth = len(stack)
+                if tag == _W_P:
+                    if depth == 2 or (depth == 5 and stack[2] == _W_TBL and stack[4] == _W_TC):
+                        para_depth = depth
+                elif tag == _W_R and para_depth:
+                    if depth == para_depth + 1 or (depth == para_depth + 2 and stack[-1] == _W_HYPERLINK):
+                        run_depth = depth
+                elif tag == _W_TC and depth == 4 and stack[2] == _W_TBL:
+                    grid_span, v_merged = 1, False
+                elif tag == _W_TBL and depth == 2:
+                    tables.write("\n[TABLE]\n")
+                    above = []
+                stack.append(tag)
+                continue
+
+            stack.pop()
+            depth = len(stack)
+            if run_depth and depth == run_depth + 1:
+                if tag == _W_T:
+                    para.append(el.text or "")
+                elif tag == _W_TAB:
+                    para.append("\t")
+                elif tag == _W_BR or tag == _W_CR:
+                    para.append("\n")
+            elif tag == _W_R and depth == run_depth:
+                run_depth = 0
+            elif tag == _W_P and depth == para_depth:
+                text = "".join(para)
+                para.clear()
+                para_depth = 0
+                if depth == 2:
+                    if text and not text.isspace():
+                        body.write(text)
+                        body.write("\n")
                 else:
-                    ws = wb.create_sheet(sheet_name)
-                
-                if data and isinstance(data[0], dict):
-                    headers = list(data[0].keys())
-                    if use_headers:
-                        ws.append(headers)
-                    for row_data in data:
-                        ws.append([row_data.get(h, "") for h in headers])
+                    cell_paras.append(text)
+            elif depth == 6 and stack[5] == _W_TCPR and stack[2] == _W_TBL:
+                if tag == _W_GRIDSPAN:
+                    grid_span = int(el.get(_W_VAL, "1"))
+                elif tag == _W_VMERGE:
+                    v_merged = el.get(_W_VAL, "continue") == "continue"
+            elif depth == 4 and tag == _W_TC and stack[2] == _W_TBL:
+                if v_merged:
+                    col = len(row_cells)
+                    row_cells.extend(above[col:col + grid_span])
                 else:
-                    for row in data:
-                        ws.append(row)
-            
-            wb.save(path)
-            return [types.TextContent(type="text", text=f"Created: {path}")]
-
-        elif name == "append_to_txt":
-            path = arguments["path"]
-            content = arguments["content"]
-            with open(path, 'a', encoding='utf-8') as f:
-                f.write("\n" + content)
-            return [types.TextContent(type="text", text=f"Appended to: {path}")]
-
-        elif name == "append_to_csv":
-            path = _validate_path(arguments["path"])
-            data = json.loads(arguments["data"])
-            df = pd.DataFrame(data)
-            df.to_csv(path, mode='a', index=False, header=False)
-            return [types.TextContent(type="text", text=f"Appended {len(data)} rows to: {path}")]
-
-        elif name == "list_directory":
-            path = arguments["path"]
-            pattern = arguments.get("pattern", "*")
-            import glob
-            files = glob.glob(os.path.join(path, pattern))
-            result = [{"name": os.path.basename(f), "path": f, "is_dir": os.path.isdir(f)} for f in files]
-            return [types.TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-
-        elif name == "get_file_info":
-            path = _validate_path(arguments["path"])
-            stat = os.stat(path)
-            info = {
-                "path": path,
-                "size": stat.st_size,
-                "size_human": _human_readable_size(stat.st_size),
-                "modified": stat.st_mtime,
-                "is_file": os.path.isfile(path),
-                "is_dir": os.path.isdir(path)
-            }
-            return [types.TextContent(type="text", text=json.dumps(info, ensure_ascii=False, indent=2))]
-
-        else:
-            return [types.TextContent(type="text", text=f"Unknown tool: {name}")]
+                    row_cells.extend(["\n".join(cell_paras)] * grid_span)
+                cell_paras.clear()
+            elif depth == 3 and tag == _W_TR and stack[2] == _W_TBL:
+                tables.write(" | ".join(row_cells))
+                tables.write("\n")
+                above, row_cells = row_cells, []
+                el.clear()
+            if depth == 2:
+                el.clear()
 
-    except Exception as e:
-        return [types.TextContent(type="text", text=f"Error: {str(e)}")]
+    # Drop the trailing separator so output matches a "\n".join() of the parts
+    return (body.getvalue() + tables.getvalue())[:-1]
 
 
 def _parse_page_range(pages_str: str, total_pages: int) -> List[int]:
@@ -367,12 +523,18 @@ def _parse_page_range(pages_str: str, total_pages: int) -> List[int]:
     return sorted(pages)
 
 
+def _csv_fieldnames(rows: List[Dict[str, Any]]) -> List[str]:
+    # Union of keys in first-seen order, same column layout pandas produced
+    return list(dict.fromkeys(key for row in rows for key in row))
+
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+
 def _human_readable_size(size: int) -> str:
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size < 1024:
-            return f"{size:.1f} {unit}"
-        size /= 1024
-    return f"{size:.1f} TB"
+    # Each unit is 2**10 of the previous one, so bit_length picks it directly
+    exp = min((size.bit_length() - 1) // 10, 4) if size > 0 else 0
+    return f"{size / (1 << (exp * 10)):.1f} {_SIZE_UNITS[exp]}"
 
 
 async def main():
@@ -2,6 +2,7 @@
 """Simple HTTP server for file downloads"""
 
 import http.server
+import io
 import socketserver
 import os
 import sys
@@ -19,26 +20,36 @@ class Handler(http.server.SimpleHTTPRequestHandler):
     def log_message(self, format, *args):
         print(f"[{self.log_date_time_string()}] {args[0]}")
     
+    def copyfile(self, source, outputfile):
+        """Send file bodies with sendfile(2) instead of a read/write loop"""
+        if outputfile is not self.wfile:
+            return super().copyfile(source, outputfile)
+        self.wfile.flush()
+        # socket.sendfile falls back to plain send() for non-regular files
+        self.connection.sendfile(source)
+    
     def list_directory(self, path):
         """Custom directory listing with domain URLs"""
         try:
-            listdir = os.listdir(path)
+            with os.scandir(path) as it:
+                dir_entries = sorted(it, key=lambda e: e.name.lower())
         except OSError:
             self.send_error(404, "No permission to list directory")
             return None
         
-        listdir.sort(key=lambda a: a.lower())
-        f = []
-        for name in listdir:
-            fullname = os.path.join(path, name)
-            displayname = linkname = name
-            if os.path.isdir(fullname):
-                displayname = name + "/"
-                linkname = name + "/"
-            if os.path.islink(fullname):
-                displayname = name + "@"
-            href = f"{DOMAIN}:{PORT}/{quote(linkname)}"
-            f.append(f'<li><a href="{href}">{displayname}</a></li>')
+        entries = []
+        for entry in dir_entries:
+            displayname = linkname = entry.name
+            if entry.is_dir():
+                displayname = linkname = entry.name + "/"
+            if entry.is_symlink():
+                displayname = entry.name + "@"
+            entries.append((displayname, linkname))
+        
+        prefix = f"{DOMAIN}:{PORT}/"
+        items = '\n        '.join(
+            f'<li><a href="{prefix}{quote(ln)}">{dn}</a></li>' for dn, ln in entries
+        )
         
         html = f"""<!DOCTYPE html>
 <html>
@@ -55,7 +66,7 @@ class Handler(http.server.SimpleHTTPRequestHandler):
 <body>
     <h1>Download Files</h1>
     <ul>
-        {''.join(f)}
+        {items}
     </ul>
 </body>
 </html>"""
@@ -64,12 +75,13 @@ class Handler(http.server.SimpleHTTPRequestHandler):
         self.send_header("Content-Type", "text/html; charset=utf-8")
         self.send_header("Content-Length", str(len(encoded)))
         self.end_headers()
-        return f
+        return io.BytesIO(encoded)
 
 print(f"Serving files from: {os.path.abspath(DIRECTORY)}")
 print(f"URL: http://{HOST}:{PORT}/")
 print(f"Download links use: {DOMAIN}:{PORT}/")
 print("Press Ctrl+C to stop")
 
-with socketserver.TCPServer((HOST, PORT), Handler) as httpd:
+with socketserver.ThreadingTCPServer((HOST, PORT), Handler) as httpd:
+    httpd.daemon_threads = True
     httpd.serve_forever()
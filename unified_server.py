@@ -1,18 +1,45 @@
 #!/usr/bin/env python3
 """Unified file server: download + upload on single port"""
 
+import atexit
+import gzip
 import http.server
 import socketserver
 import os
+import re
 import sys
 import json
 import uuid
 import shutil
+import signal
+import sqlite3
+import stat
+import threading
 import time
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
 from urllib.parse import quote, unquote
 from werkzeug.utils import secure_filename
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    json_loads = json.loads
+
 PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
 HOST = "172.24.1.204"
 DOMAIN = "https://files.netwize.work"
@@ -21,61 +48,344 @@ SESSIONS_DIR = os.path.join(BASE_DIR, "sessions")
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
 SESSION_FILE = os.path.join(BASE_DIR, "sessions.json")
 TOKENS_FILE = os.path.join(BASE_DIR, "tokens.json")
+STATE_DB = os.path.join(BASE_DIR, "state.sqlite3")
 SESSION_TTL_HOURS = 24
 TOKEN_TTL_MINUTES = 30
 MAX_FILE_SIZE = 50 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+RESPONSE_BUFFER_SIZE = 64 * 1024
+MAX_API_BODY_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 30  # seconds a keep-alive connection may sit idle or stall
+DOWNLOAD_MAX_AGE = 60
+GZIP_MIN_SIZE = 512
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+MAX_PART_HEADER_SIZE = 16 * 1024
+TOKEN_FLUSH_INTERVAL = 1.0
+CLEANUP_INTERVAL = 60
 
 os.makedirs(SESSIONS_DIR, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# Parsed JSON state keyed on the file's (mtime_ns, size); only re-read when it changes
+_state_lock = threading.RLock()
+_sessions_cache = {"version": None, "data": {}}
+
+# Tokens are owned by this process: the in-memory dict is authoritative and
+# changed records are written to SQLite in the background by _token_flusher
+_db = None
+_tokens = None
+_dirty_tokens = {}
+_tokens_version = 0
+_flush_lock = threading.Lock()
+_flush_pending = threading.Event()
+_uploads_in_progress = set()
+
+def _try_stat(path):
+    """Return (exists, stat_result) with a single stat() call"""
+    try:
+        return True, os.stat(path)
+    except OSError:
+        return False, None
+
+def _file_version(path):
+    exists, st = _try_stat(path)
+    if not exists:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def load_json_cached(path, cache, prepare=None):
+    with _state_lock:
+        version = _file_version(path)
+        if version is None:
+            return {}
+        if cache["version"] != version:
+            with open(path, 'rb') as f:
+                data = json_loads(f.read())
+            cache["data"] = prepare(data) if prepare else data
+            cache["version"] = version
+        return cache["data"]
+
+def save_json_cached(path, cache, data):
+    with _state_lock:
+        # Other processes write the same file, so the temp name carries our pid
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(json_dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        cache["data"] = data
+        cache["version"] = _file_version(path)
+
+def _backfill_expires_ts(records):
+    # Records written by other tools may only carry the ISO 'expires' string
+    for data in records.values():
+        if 'expires_ts' not in data:
+            data['expires_ts'] = int(datetime.fromisoformat(data['expires']).timestamp())
+    return records
+
 def load_sessions():
-    if os.path.exists(SESSION_FILE):
-        with open(SESSION_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    return load_json_cached(SESSION_FILE, _sessions_cache, _backfill_expires_ts)
 
 def save_sessions(sessions):
-    with open(SESSION_FILE, 'w') as f:
-        json.dump(sessions, f, indent=2)
+    save_json_cached(SESSION_FILE, _sessions_cache, sessions)
 
-def load_tokens():
+def _load_legacy_tokens():
+    """Read the tokens.json written by older versions, to seed the database"""
+    tokens = {}
     if os.path.exists(TOKENS_FILE):
-        with open(TOKENS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+        with open(TOKENS_FILE, 'rb') as f:
+            tokens = json_loads(f.read())
+    return _backfill_expires_ts(tokens)
+
+def get_db():
+    global _db
+    with _state_lock:
+        if _db is None:
+            conn = sqlite3.connect(STATE_DB, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS tokens ('
+                         'token TEXT PRIMARY KEY, data BLOB NOT NULL, expires_ts INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tokens_expires_ts ON tokens (expires_ts)')
+            if conn.execute('SELECT 1 FROM tokens LIMIT 1').fetchone() is None:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)',
+                    [(t, json_dumps(d), d['expires_ts']) for t, d in _load_legacy_tokens().items()])
+            _db = conn
+        return _db
+
+def load_tokens():
+    global _tokens
+    with _state_lock:
+        if _tokens is None:
+            rows = get_db().execute('SELECT token, data FROM tokens').fetchall()
+            _tokens = {token: json_loads(data) for token, data in rows}
+        return _tokens
+
+def get_token(token):
+    return load_tokens().get(token)
 
-def save_tokens(tokens):
-    with open(TOKENS_FILE, 'w') as f:
-        json.dump(tokens, f, indent=2)
+def _mark_dirty(token, data):
+    # data=None records a deletion
+    global _tokens_version
+    _dirty_tokens[token] = data
+    _tokens_version += 1
+    _flush_pending.set()
+
+def upsert_token(token, data):
+    with _state_lock:
+        load_tokens()[token] = data
+        _mark_dirty(token, data)
+
+def cleanup_expired_tokens():
+    """Drop every expired token; return how many were removed"""
+    with _state_lock:
+        tokens = load_tokens()
+        now = time.time()
+        expired = [t for t, data in tokens.items() if data['expires_ts'] < now]
+        for token in expired:
+            del tokens[token]
+            _mark_dirty(token, None)
+    return len(expired)
+
+def flush_tokens():
+    """Write token changes made since the last flush to SQLite"""
+    global _dirty_tokens
+    with _flush_lock:
+        with _state_lock:
+            pending, _dirty_tokens = _dirty_tokens, {}
+        if not pending:
+            return
+        conn = get_db()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)',
+                             [(t, json_dumps(d), d['expires_ts']) for t, d in pending.items() if d is not None])
+            conn.executemany('DELETE FROM tokens WHERE token = ?',
+                             [(t,) for t, d in pending.items() if d is None])
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            with _state_lock:
+                # Keep anything newer that was recorded while we were writing
+                _dirty_tokens = {**pending, **_dirty_tokens}
+            raise
+
+def _token_flusher():
+    while True:
+        _flush_pending.wait()
+        _flush_pending.clear()
+        try:
+            flush_tokens()
+        except sqlite3.Error as e:
+            print(f"[{datetime.now().isoformat()}] Token flush failed: {e}")
+            _flush_pending.set()
+        # Let further changes pile up so a burst costs one transaction
+        time.sleep(TOKEN_FLUSH_INTERVAL)
+
+@lru_cache(maxsize=8192)
+def _token_status(token, version):
+    data = get_token(token)
+    if data is None:
+        return None
+    return (bool(data.get('used')), data['expires_ts'], data.get('filename'), data['expires'])
+
+def token_status(token):
+    """Return (used, expires_ts, filename, expires) for a token, or None if unknown.
+
+    Memoized per token-store version, so any mutation invalidates it.
+    """
+    return _token_status(token, _tokens_version)
+
+def claim_token(token):
+    """Reserve a valid token for one in-flight upload; return its record or None"""
+    with _state_lock:
+        data = get_token(token)
+        if data is None or data.get('used') or token in _uploads_in_progress:
+            return None
+        if time.time() > data['expires_ts']:
+            return None
+        _uploads_in_progress.add(token)
+        return data
+
+def release_token(token):
+    with _state_lock:
+        _uploads_in_progress.discard(token)
 
 def cleanup_expired_sessions():
+    with _state_lock:
+        _cleanup_expired_sessions()
+
+def _cleanup_expired_sessions():
     sessions = load_sessions()
-    now = datetime.now()
+    now = time.time()
     expired = []
     for sid, data in sessions.items():
-        expires = datetime.fromisoformat(data['expires'])
-        if now > expires:
+        if now > data['expires_ts']:
             session_path = os.path.join(SESSIONS_DIR, sid)
             if os.path.exists(session_path):
                 shutil.rmtree(session_path)
             expired.append(sid)
-    for sid in expired:
-        del sessions[sid]
     if expired:
-        save_sessions(sessions)
+        # Save a new dict rather than mutating the cached one other threads may be reading
+        save_sessions({sid: data for sid, data in sessions.items() if sid not in expired})
+
+def _janitor():
+    while True:
+        time.sleep(CLEANUP_INTERVAL)
+        try:
+            cleanup_expired_tokens()
+            cleanup_expired_sessions()
+        except Exception as e:
+            # Other servers rewrite sessions.json in place, so a read can see
+            # a half-written file; keep the thread alive for the next round
+            print(f"[{datetime.now().isoformat()}] Cleanup failed: {e!r}")
+
+class MultipartFileReader:
+    """Incremental reader for the file part of a multipart/form-data body.
+
+    Reads the request in UPLOAD_CHUNK_SIZE pieces and only keeps a
+    boundary-sized tail in memory, so uploads go to disk as they arrive.
+    """
+
+    def __init__(self, rfile, boundary, content_length):
+        self.rfile = rfile
+        self.remaining = content_length
+        self.buf = bytearray()
+        self.delimiter = b'--' + boundary
+        self.terminator = b'\r\n--' + boundary
+
+    def _fill(self):
+        if self.remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(UPLOAD_CHUNK_SIZE, self.remaining))
+        if not chunk:
+            self.remaining = 0
+            return False
+        self.remaining -= len(chunk)
+        self.buf += chunk
+        return True
+
+    def _find(self, needle, limit=None):
+        while True:
+            i = self.buf.find(needle)
+            if i >= 0:
+                return i
+            if limit is not None and len(self.buf) > limit:
+                return -1
+            if not self._fill():
+                return -1
+
+    def _skip_part_body(self):
+        while True:
+            i = self.buf.find(self.terminator)
+            if i >= 0:
+                del self.buf[:i + len(self.terminator)]
+                return True
+            keep = len(self.terminator) - 1
+            del self.buf[:-keep]
+            if not self._fill():
+                return False
+
+    def next_file(self):
+        """Skip to the first part carrying a filename and return that name"""
+        i = self._find(self.delimiter)
+        if i < 0:
+            return None
+        del self.buf[:i + len(self.delimiter)]
+        while True:
+            while len(self.buf) < 2 and self._fill():
+                pass
+            if self.buf[:2] != b'\r\n':
+                return None  # closing "--" delimiter or malformed body
+            end = self._find(b'\r\n\r\n', MAX_PART_HEADER_SIZE)
+            if end < 0:
+                return None
+            i = self.buf.find(b'filename="', 2, end)
+            if i >= 0:
+                i += len(b'filename="')
+                j = self.buf.find(b'"', i, end)
+                fn_match = self.buf[i:j if j >= 0 else end]
+                del self.buf[:end + 4]
+                return fn_match.decode('utf-8', errors='replace')
+            del self.buf[:end + 4]
+            if not self._skip_part_body():
+                return None
+
+    def _write(self, f, n):
+        # Hand the buffer to write() without slicing out a copy first
+        with memoryview(self.buf) as view:
+            f.write(view[:n])
+
+    def copy_to(self, f):
+        """Write the current part body to f; return its size in bytes"""
+        size = 0
+        keep = len(self.terminator) - 1
+        while True:
+            i = self.buf.find(self.terminator)
+            if i >= 0:
+                self._write(f, i)
+                size += i
+                self.drain()
+                return size
+            n = len(self.buf) - keep
+            if n > 0:
+                self._write(f, n)
+                size += n
+                del self.buf[:n]
+            if not self._fill():
+                raise ValueError("Upload ended before the closing boundary")
+
+    def drain(self):
+        """Discard whatever is left of the request body"""
+        self.buf.clear()
+        while self.remaining > 0:
+            chunk = self.rfile.read(min(UPLOAD_CHUNK_SIZE, self.remaining))
+            if not chunk:
+                break
+            self.remaining -= len(chunk)
 
-def cleanup_expired_tokens():
-    tokens = load_tokens()
-    now = datetime.now()
-    expired = []
-    for token, data in tokens.items():
-        expires = datetime.fromisoformat(data['expires'])
-        if now > expires:
-            expired.append(token)
-    for token in expired:
-        del tokens[token]
-    if expired:
-        save_tokens(tokens)
 
 UPLOAD_HTML = '''
 <!DOCTYPE html>
@@ -215,53 +525,150 @@ ERROR_HTML = '''
 </head><body><div class="error"><h1>⚠️ Invalid Link</h1><p>This upload link is invalid or has expired.</p></div></body></html>
 '''
 
+# Encoded once; the upload page only varies by the expiry timestamp
+_UPLOAD_HEAD, _UPLOAD_TAIL = [part.encode('utf-8') for part in UPLOAD_HTML.split('{{ expires_ts }}')]
+_ERROR_HTML_BYTES = ERROR_HTML.encode('utf-8')
+
+
+def precompress(body):
+    """Return {content-coding: bytes} for a page that is served many times"""
+    variants = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+_ERROR_HTML_VARIANTS = precompress(_ERROR_HTML_BYTES)
+
+
+_LIST_HEAD = ("""<!DOCTYPE html><html><head><title>Files</title>
+<style>body{font-family:Arial,sans-serif;margin:40px;background:#f5f5f5;}.container{max-width:800px;margin:0 auto;background:white;padding:20px;border-radius:8px;}h1{color:#333;}.session{margin:20px 0;padding:15px;background:#fafafa;border-left:4px solid #4CAF50;}.session h3{margin:0 0 10px 0;}.meta{font-size:12px;color:#666;margin-bottom:10px;}.files{list-style:none;padding:0;}.files li{margin:5px 0;}.files a{color:#0066cc;text-decoration:none;}.files a:hover{text-decoration:underline;}</style></head><body><div class="container"><h1>Shared Files</h1>""").encode('utf-8')
+_LIST_FOOT = b'</div></body></html>'
+
+# Static pieces of a single session's file page
+_FILES_HEAD = b'<!DOCTYPE html><html><head><title>Session '
+_FILES_STYLE = (b'</title>\n<style>body{font-family:Arial,sans-serif;margin:40px;}ul{list-style:none;padding:0;}li{margin:10px 0;}a{color:#0066cc;text-decoration:none;font-size:16px;}a:hover{text-decoration:underline;}.meta{color:#666;margin-bottom:20px;}</style></head><body><h1>Files</h1><div class="meta">Session: ')
+_FILES_EXPIRES = b'<br>Expires: '
+_FILES_LIST = b'</div><ul>'
+_FILES_ITEM_OPEN = b'<li><a href="'
+_FILES_ITEM_MID = b'">'
+_FILES_ITEM_CLOSE = b'</a></li>'
+_FILES_FOOT = b'</ul></body></html>'
+
+# Rendered HTML for the "/" listing: whole page keyed on the sessions.json
+# version, plus one fragment per session reused while its files don't change
+_list_page_cache = {"version": None, "valid_until": 0, "body": None, "variants": None}
+_session_frag_cache = {}
+
+def _session_fragment(sid, data):
+    key = (tuple(data['files']), data['expires'])
+    cached = _session_frag_cache.get(sid)
+    if cached and cached[0] == key:
+        return cached[1]
+    items = ''.join(f'<li><a href="{DOMAIN}/{sid}/{quote(fname)}">{fname}</a></li>' for fname in data['files'])
+    html = f'<div class="session"><h3>Session: {sid[:8]}...</h3><div class="meta">Files: {len(data["files"])} | Expires: {data["expires"][:19]}</div><ul class="files">{items}</ul></div>'
+    fragment = html.encode('utf-8')
+    _session_frag_cache[sid] = (key, fragment)
+    return fragment
+
 
 class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep-alive: every response carries a Content-Length
+    protocol_version = 'HTTP/1.1'
+    wbufsize = RESPONSE_BUFFER_SIZE
+    timeout = REQUEST_TIMEOUT
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=SESSIONS_DIR, **kwargs)
     
     def log_message(self, format, *args):
         print(f"[{self.log_date_time_string()}] {args[0]}")
     
+    def accepted_encoding(self, available):
+        """Pick the preferred content-coding from available that the client accepts"""
+        accepted = set()
+        for item in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = item.partition(';')
+            q = params.replace(' ', '').partition('q=')[2]
+            try:
+                if q and float(q) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in available and (encoding in accepted or '*' in accepted):
+                return encoding
+        return None
+    
+    def send_body(self, body, code=200, content_type='text/html; charset=utf-8', variants=None):
+        # HTML is compressed when the client allows it: from the precompressed
+        # variants if given, otherwise gzip on the fly
+        encoding = None
+        is_html = content_type.startswith('text/html')
+        if is_html and (variants or len(body) >= GZIP_MIN_SIZE):
+            encoding = self.accepted_encoding(variants or ('gzip',))
+            if encoding:
+                body = variants[encoding] if variants else gzip.compress(body, compresslevel=6, mtime=0)
+        # wfile is buffered, so headers and body leave in one send() when the
+        # request is flushed
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if is_html:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_json(self, obj, code=200):
+        self.send_body(json_dumps(obj), code, 'application/json')
+    
+    def read_body(self):
+        """Read the whole request body so the next keep-alive request starts
+        at the right place. Chunked or oversized bodies are refused with an
+        error response and None is returned"""
+        if self.headers.get('Transfer-Encoding'):
+            self.close_connection = True
+            self.send_json({'error': 'Content-Length required'}, 411)
+            return None
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > MAX_API_BODY_SIZE:
+            self.close_connection = True
+            self.send_json({'error': 'Request body too large'}, 413)
+            return None
+        return self.rfile.read(content_length)
+    
+    def send_upload_error(self, message):
+        # The request body may be partly unread, so it can't be reused for keep-alive
+        self.close_connection = True
+        self.send_json({'error': message}, 400)
+    
+    def send_error_page(self):
+        self.send_body(_ERROR_HTML_BYTES, variants=_ERROR_HTML_VARIANTS)
+    
     def do_GET(self):
         path = unquote(self.path)
         
         if path == '/health':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(b'{"status":"ok"}')
+            self.send_body(b'{"status":"ok"}', content_type='application/json')
             return
         
         # Upload page: /upload/<token>
         if path.startswith('/upload/'):
             token = path[8:].split('?')[0].rstrip('/')
-            tokens = load_tokens()
-            if token not in tokens:
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(ERROR_HTML.encode('utf-8'))
+            status = token_status(token)
+            if status is None:
+                self.send_error_page()
                 return
-            data = tokens[token]
-            if datetime.now() > datetime.fromisoformat(data['expires']):
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(ERROR_HTML.encode('utf-8'))
+            used, expires_ts, _, _ = status
+            if time.time() > expires_ts:
+                self.send_error_page()
                 return
-            if data.get('used'):
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(ERROR_HTML.encode('utf-8'))
+            if used:
+                self.send_error_page()
                 return
-            expires_ts = data.get('expires_ts', int(datetime.fromisoformat(data['expires']).timestamp()))
-            html = UPLOAD_HTML.replace('{{ expires_ts }}', str(expires_ts))
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(html.encode('utf-8'))
+            self.send_body(b''.join((_UPLOAD_HEAD, str(expires_ts).encode(), _UPLOAD_TAIL)))
             return
         
         # List sessions: /
@@ -273,17 +680,15 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
         parts = path.strip('/').split('/', 1)
         if len(parts) >= 1 and parts[0]:
             sid = parts[0]
-            session_path = os.path.join(SESSIONS_DIR, sid)
-            if not os.path.exists(session_path):
-                self.send_error(404, "Session not found")
-                return
             if len(parts) == 1:
                 self.list_session_files(sid)
                 return
             filename = parts[1]
-            file_path = os.path.join(session_path, filename)
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                self.serve_file(file_path, filename)
+            file_path = os.path.join(SESSIONS_DIR, sid, filename)
+            # A missing session directory simply fails this stat too
+            exists, st = _try_stat(file_path)
+            if exists and stat.S_ISREG(st.st_mode):
+                self.serve_file(file_path, filename, st)
                 return
             self.send_error(404, "File not found")
             return
@@ -296,196 +701,258 @@ class UnifiedHandler(http.server.SimpleHTTPRequestHandler):
         # Upload file: /upload/<token>
         if path.startswith('/upload/'):
             token = path[8:].rstrip('/')
-            tokens = load_tokens()
-            if token not in tokens:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error": "Invalid token"}')
+            if token_status(token) is None:
+                self.send_upload_error("Invalid token")
                 return
-            data = tokens[token]
-            if datetime.now() > datetime.fromisoformat(data['expires']) or data.get('used'):
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error": "Token expired or used"}')
+            data = claim_token(token)
+            if data is None:
+                self.send_upload_error("Token expired or used")
                 return
-            
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length > MAX_FILE_SIZE:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error": "File too large"}')
-                return
-            
-            content_type = self.headers.get('Content-Type', '')
-            if 'multipart/form-data' not in content_type:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error": "No multipart form data"}')
-                return
-            
-            # Parse multipart
-            boundary = content_type.split('boundary=')[1].encode()
-            body = self.rfile.read(content_length)
-            
-            # Extract file
-            parts = body.split(b'--' + boundary)
-            filename = None
-            file_content = None
-            
-            for part in parts:
-                if b'filename=' in part:
-                    headers, _, content = part.partition(b'\r\n\r\n')
-                    fn_match = headers.split(b'filename="')[1].split(b'"')[0]
-                    filename = fn_match.decode('utf-8', errors='replace')
-                    file_content = content.rstrip(b'\r\n')
-                    break
-            
-            if not filename or file_content is None:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(b'{"error": "No file in request"}')
-                return
-            
-            # Save file
-            filename = secure_filename(filename) or f"upload_{int(time.time())}"
-            name, ext = os.path.splitext(filename)
-            filename = f"{name}_{int(time.time())}{ext}"
-            filepath = os.path.join(UPLOADS_DIR, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(file_content)
-            
-            # Mark token used
-            tokens[token]['used'] = True
-            tokens[token]['filename'] = filename
-            tokens[token]['uploaded_at'] = datetime.now().isoformat()
-            tokens[token]['size'] = len(file_content)
-            save_tokens(tokens)
-            
-            print(f"[{datetime.now().isoformat()}] File uploaded: {filename}")
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'success': True, 'filename': filename}).encode())
+            try:
+                self.receive_upload(token, data)
+            finally:
+                release_token(token)
+            return
+        
+        body = self.read_body()
+        if body is None:
             return
         
         # API: create token
         if path == '/api/create_token':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
             try:
-                data = json.loads(body) if body else {}
+                data = json_loads(body) if body else {}
             except:
                 data = {}
             
-            cleanup_expired_tokens()
-            token = str(uuid.uuid4())
+            token = uuid.uuid4().hex
             now = datetime.now()
             expires = now + timedelta(minutes=TOKEN_TTL_MINUTES)
             expires_ts = int(expires.timestamp())
             
-            tokens = load_tokens()
-            tokens[token] = {
+            upsert_token(token, {
                 'created': now.isoformat(),
                 'expires': expires.isoformat(),
                 'expires_ts': expires_ts,
                 'description': data.get('description', ''),
                 'used': False,
                 'filename': None
-            }
-            save_tokens(tokens)
+            })
             
             url = f"{DOMAIN}/upload/{token}"
             response = {'token': token, 'url': url, 'expires': expires.isoformat()}
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(response)
             return
         
         # API: check token
         if path.startswith('/api/check/'):
             token = path[11:]
-            tokens = load_tokens()
-            if token not in tokens:
+            status = token_status(token)
+            if status is None:
                 response = {'exists': False, 'error': 'Invalid token'}
             else:
-                data = tokens[token]
+                used, expires_ts, filename, expires = status
                 response = {
                     'exists': True,
-                    'used': data.get('used', False),
-                    'filename': data.get('filename'),
-                    'expires': data['expires'],
-                    'expired': datetime.now() > datetime.fromisoformat(data['expires'])
+                    'used': used,
+                    'filename': filename,
+                    'expires': expires,
+                    'expired': time.time() > expires_ts
                 }
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(response)
             return
         
+        self.close_connection = True
         self.send_error(404, "Not found")
     
+    def receive_upload(self, token, data):
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length > MAX_FILE_SIZE:
+            self.send_upload_error("File too large")
+            return
+        
+        content_type = self.headers.get('Content-Type', '')
+        if 'multipart/form-data' not in content_type:
+            self.send_upload_error("No multipart form data")
+            return
+        
+        # Parse multipart
+        boundary = content_type.split('boundary=')[1].encode()
+        reader = MultipartFileReader(self.rfile, boundary, content_length)
+        filename = reader.next_file()
+        
+        if not filename:
+            self.send_upload_error("No file in request")
+            return
+        
+        # Save file
+        filename = secure_filename(filename) or f"upload_{int(time.time())}"
+        name, ext = os.path.splitext(filename)
+        filename = f"{name}_{int(time.time())}{ext}"
+        filepath = os.path.join(UPLOADS_DIR, filename)
+        
+        # Stream into a per-token file and only give it the real name once the
+        # whole part arrived, so an aborted upload never looks like a finished one
+        partial = os.path.join(UPLOADS_DIR, f".{token}.part")
+        try:
+            with open(partial, 'wb') as f:
+                size = reader.copy_to(f)
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if isinstance(e, (ValueError, TimeoutError)):
+                self.send_upload_error("Incomplete upload")
+                return
+            raise
+        os.replace(partial, filepath)
+        
+        # Mark token used
+        upsert_token(token, dict(
+            data,
+            used=True,
+            filename=filename,
+            uploaded_at=datetime.now().isoformat(),
+            size=size,
+        ))
+        
+        print(f"[{datetime.now().isoformat()}] File uploaded: {filename}")
+        
+        self.send_json({'success': True, 'filename': filename})
+    
     def list_sessions(self):
-        cleanup_expired_sessions()
-        sessions = load_sessions()
-        html = """<!DOCTYPE html><html><head><title>Files</title>
-<style>body{font-family:Arial,sans-serif;margin:40px;background:#f5f5f5;}.container{max-width:800px;margin:0 auto;background:white;padding:20px;border-radius:8px;}h1{color:#333;}.session{margin:20px 0;padding:15px;background:#fafafa;border-left:4px solid #4CAF50;}.session h3{margin:0 0 10px 0;}.meta{font-size:12px;color:#666;margin-bottom:10px;}.files{list-style:none;padding:0;}.files li{margin:5px 0;}.files a{color:#0066cc;text-decoration:none;}.files a:hover{text-decoration:underline;}</style></head><body><div class="container"><h1>Shared Files</h1>"""
-        if sessions:
-            for sid, data in sessions.items():
-                html += f'<div class="session"><h3>Session: {sid[:8]}...</h3><div class="meta">Files: {len(data["files"])} | Expires: {data["expires"][:19]}</div><ul class="files">'
-                for fname in data['files']:
-                    url = f"{DOMAIN}/{sid}/{quote(fname)}"
-                    html += f'<li><a href="{url}">{fname}</a></li>'
-                html += '</ul></div>'
-        else:
-            html += '<p>No active sessions</p>'
-        html += '</div></body></html>'
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        with _state_lock:
+            sessions = load_sessions()
+            version = _sessions_cache["version"]
+            page = _list_page_cache
+            now = time.time()
+            if page["body"] is None or page["version"] != version or now > page["valid_until"]:
+                # The janitor removes expired sessions; until it runs, just hide them
+                sessions = {sid: data for sid, data in sessions.items() if now <= data['expires_ts']}
+                parts = [_LIST_HEAD]
+                if sessions:
+                    parts.extend(_session_fragment(sid, data) for sid, data in sessions.items())
+                else:
+                    parts.append(b'<p>No active sessions</p>')
+                parts.append(_LIST_FOOT)
+                for sid in [sid for sid in _session_frag_cache if sid not in sessions]:
+                    del _session_frag_cache[sid]
+                page["version"] = version
+                # Re-render once the first listed session expires
+                page["valid_until"] = min((d['expires_ts'] for d in sessions.values()), default=float('inf'))
+                page["body"] = b''.join(parts)
+                page["variants"] = precompress(page["body"])
+            body, variants = page["body"], page["variants"]
+        self.send_body(body, variants=variants)
     
     def list_session_files(self, sid):
         sessions = load_sessions()
-        if sid not in sessions:
+        if sid not in sessions or time.time() > sessions[sid]['expires_ts']:
             self.send_error(404, "Session not found")
             return
         data = sessions[sid]
-        html = f"""<!DOCTYPE html><html><head><title>Session {sid[:8]}</title>
-<style>body{{font-family:Arial,sans-serif;margin:40px;}}ul{{list-style:none;padding:0;}}li{{margin:10px 0;}}a{{color:#0066cc;text-decoration:none;font-size:16px;}}a:hover{{text-decoration:underline;}}.meta{{color:#666;margin-bottom:20px;}}</style></head><body><h1>Files</h1><div class="meta">Session: {sid}<br>Expires: {data['expires'][:19]}</div><ul>"""
+        sid_bytes = sid.encode('utf-8')
+        base_url = f"{DOMAIN}/{sid}/".encode('utf-8')
+        parts = [_FILES_HEAD, sid[:8].encode('utf-8'), _FILES_STYLE, sid_bytes,
+                 _FILES_EXPIRES, data['expires'][:19].encode('utf-8'), _FILES_LIST]
         for fname in data['files']:
-            url = f"{DOMAIN}/{sid}/{quote(fname)}"
-            html += f'<li><a href="{url}">{fname}</a></li>'
-        html += '</ul></body></html>'
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+            parts += (_FILES_ITEM_OPEN, base_url, quote(fname).encode('ascii'),
+                      _FILES_ITEM_MID, fname.encode('utf-8'), _FILES_ITEM_CLOSE)
+        parts.append(_FILES_FOOT)
+        self.send_body(b''.join(parts))
     
-    def serve_file(self, filepath, filename):
-        size = os.path.getsize(filepath)
-        self.send_response(200)
+    def is_not_modified(self, etag, mtime):
+        """Check the request's conditional headers against the file's validators"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match takes precedence; it uses the weak comparison
+            tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+    def requested_range(self, size, etag):
+        """Return (start, end) for a single-range request, None to send the
+        whole file, or False when the range can't be satisfied"""
+        match = RANGE_RE.match(self.headers.get('Range', '').replace(' ', ''))
+        if not match or not any(match.groups()):
+            return None  # absent, multi-range or unknown unit: ignore it
+        # If-Range needs the strong comparison, so weak tags and dates never match
+        if_range = self.headers.get('If-Range')
+        if if_range is not None and if_range.strip() != etag:
+            return None
+        first, last = match.groups()
+        if not first:
+            suffix = int(last)
+            if suffix == 0:
+                return False
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None  # invalid range like bytes=5-3: ignore the header
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            return False
+        return start, end
+
+    def serve_file(self, filepath, filename, st):
+        size = st.st_size
+        etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+        if self.is_not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', f'public, max-age={DOWNLOAD_MAX_AGE}')
+            self.end_headers()
+            return
+        byte_range = self.requested_range(size, etag)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            start, end = 0, size - 1
+            self.send_response(200)
         self.send_header('Content-Type', 'application/octet-stream')
         self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-        self.send_header('Content-Length', str(size))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(st.st_mtime, usegmt=True))
+        self.send_header('Cache-Control', f'public, max-age={DOWNLOAD_MAX_AGE}')
         self.end_headers()
+        self.wfile.flush()
+        if end < start:
+            return  # empty file
         with open(filepath, 'rb') as f:
-            shutil.copyfileobj(f, self.wfile)
+            # socket.sendfile waits for the socket under the handler timeout
+            # instead of failing on EAGAIN, and falls back to send() where
+            # sendfile(2) can't be used (e.g. TLS)
+            self.connection.sendfile(f, start, end - start + 1)
 
 
-class ReuseAddrServer(socketserver.TCPServer):
+class ReuseAddrServer(socketserver.ThreadingTCPServer):
     allow_reuse_address = True
+    daemon_threads = True
 
 
 if __name__ == '__main__':
+    atexit.register(flush_tokens)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    threading.Thread(target=_token_flusher, daemon=True).start()
+    threading.Thread(target=_janitor, daemon=True).start()
     cleanup_expired_sessions()
     cleanup_expired_tokens()
     print(f"Unified file server started")
@@ -8,83 +8,247 @@ import sys
 import json
 import uuid
 import time
-import hashlib
+import zlib
+import heapq
+import atexit
+import signal
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
+try:
+    from streaming_form_data import StreamingFormDataParser
+    from streaming_form_data.targets import FileTarget
+    from streaming_form_data.parser import ParseFailedException
+except ImportError:
+    StreamingFormDataParser = None
+
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    json_loads = json.loads
+
 HOST = "172.24.1.204"
 PORT = 8766
 DOMAIN = "https://files.netwize.work"
 UPLOADS_DIR = "/files/uploads"
-TOKENS_FILE = "/files/tokens.json"
+UPLOAD_URL_PREFIX = f"{DOMAIN}/upload/"
+ALLOWED_API_ADDRS = frozenset({'127.0.0.1', '::1', '172.24.1.204'})
+TOKENS_FILE = "/files/tokens.json"  # shared with files_server.py; our tokens live in TOKENS_FILE.<0-f>
+TOKEN_SHARDS = 16
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 TOKEN_TTL_MINUTES = 30
+TOKENS_SAVE_DELAY = 0.1  # seconds to let a burst of token changes pile up
+SERVER_THREADS = max(8, 2 * (os.cpu_count() or 1))
+MAX_FILENAME_BYTES = 200
+API_RATE_LIMIT = 10  # requests per second per client address
+API_BURST = 10
 
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# Tokens are kept in memory keyed by their 16 UUID bytes. On disk they are
+# split by the token's first hex digit into 16 JSON files (keyed by the usual
+# UUID strings), and a background thread rewrites only the shards that changed
+_tokens = None
+_tokens_lock = threading.RLock()
+_expiry_heap = []  # (expires_ts, token), so cleanup only visits expired tokens
+_claimed = set()  # tokens with an upload in progress
+_dirty_shards = set()
+_save_lock = threading.Lock()
+_save_pending = threading.Event()
+
+# Token buckets for the internal API, keyed by client address. Only
+# ALLOWED_API_ADDRS ever get a bucket, so the dict stays tiny
+_api_buckets = {}  # addr -> (last refill time, tokens left)
+_api_buckets_lock = threading.Lock()
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
 
+def _shard_path(shard):
+    return f"{TOKENS_FILE}.{shard:x}"
+
+
+def _shard_of(key):
+    return key[0] >> 4
+
+
 def load_tokens():
-    if os.path.exists(TOKENS_FILE):
-        with open(TOKENS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    global _tokens
+    with _tokens_lock:
+        if _tokens is None:
+            stored = {}
+            paths = [path for path in map(_shard_path, range(TOKEN_SHARDS)) if os.path.exists(path)]
+            if not paths and os.path.exists(TOKENS_FILE):
+                # First start after sharding: import the single file once. It
+                # is left in place because files_server.py still uses it
+                paths = [TOKENS_FILE]
+                _dirty_shards.update(range(TOKEN_SHARDS))
+                _save_pending.set()
+            for path in paths:
+                with open(path, 'rb') as f:
+                    stored.update(json_loads(f.read()))
+            _tokens = {}
+            for token, data in stored.items():
+                key = token_key(token)
+                if key is None:
+                    continue
+                if 'expires_ts' not in data:
+                    data['expires_ts'] = int(datetime.fromisoformat(data['expires']).timestamp())
+                _tokens[key] = data
+                _expiry_heap.append((data['expires_ts'], key))
+            heapq.heapify(_expiry_heap)
+        return _tokens
+
+
+def token_key(token):
+    """Return the in-memory key for a token string, or None if it isn't a UUID"""
+    try:
+        return uuid.UUID(token).bytes
+    except ValueError:
+        return None
+
+
+def get_token(token):
+    key = token_key(token)
+    return None if key is None else load_tokens().get(key)
+
+
+def _write_file_atomic(path, payload):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
 
+def save_tokens():
+    """Rewrite the token shards that changed since the last save"""
+    global _dirty_shards
+    with _save_lock:
+        with _tokens_lock:
+            if _tokens is None or not _dirty_shards:
+                return
+            dirty, _dirty_shards = _dirty_shards, set()
+            shards = {shard: {} for shard in dirty}
+            for key, data in _tokens.items():
+                shard = shards.get(_shard_of(key))
+                if shard is not None:
+                    shard[str(uuid.UUID(bytes=key))] = data
+            payloads = {shard: json_dumps(records) for shard, records in shards.items()}
+        try:
+            for shard, payload in payloads.items():
+                _write_file_atomic(_shard_path(shard), payload)
+        except OSError:
+            with _tokens_lock:
+                _dirty_shards |= dirty
+            raise
 
-def save_tokens(tokens):
-    with open(TOKENS_FILE, 'w') as f:
-        json.dump(tokens, f, indent=2)
+
+def schedule_save(*keys):
+    """Queue the shards holding the given token keys for the background save"""
+    with _tokens_lock:
+        _dirty_shards.update(_shard_of(key) for key in keys)
+    _save_pending.set()
+
+
+def _token_saver():
+    while True:
+        _save_pending.wait()
+        time.sleep(TOKENS_SAVE_DELAY)
+        _save_pending.clear()
+        try:
+            save_tokens()
+        except OSError as e:
+            print(f"[{datetime.now().isoformat()}] Saving tokens failed: {e}")
+
+
+threading.Thread(target=_token_saver, daemon=True).start()
+atexit.register(save_tokens)
 
 
 def cleanup_expired_tokens():
-    tokens = load_tokens()
-    now = datetime.now()
-    expired = []
-    for token, data in tokens.items():
-        expires = datetime.fromisoformat(data['expires'])
-        if now > expires:
-            expired.append(token)
-    for token in expired:
-        del tokens[token]
-    if expired:
-        save_tokens(tokens)
-    return len(expired)
+    now = time.time()
+    removed = []
+    with _tokens_lock:
+        tokens = load_tokens()
+        while _expiry_heap and _expiry_heap[0][0] < now:
+            expires_ts, token = heapq.heappop(_expiry_heap)
+            # Skip entries for tokens that were already removed
+            data = tokens.get(token)
+            if data is not None and data['expires_ts'] == expires_ts:
+                del tokens[token]
+                removed.append(token)
+    if removed:
+        schedule_save(*removed)
+    return len(removed)
 
 
 def create_token(description=""):
     cleanup_expired_tokens()
-    token = str(uuid.uuid4())
+    token = uuid.uuid4()
     now = datetime.now()
     expires = now + timedelta(minutes=TOKEN_TTL_MINUTES)
     expires_ts = int(expires.timestamp())
-    tokens = load_tokens()
-    tokens[token] = {
-        'created': now.isoformat(),
-        'expires': expires.isoformat(),
-        'expires_ts': expires_ts,
-        'description': description,
-        'used': False,
-        'filename': None
-    }
-    save_tokens(tokens)
-    return token, expires
-
-
-def use_token(token):
-    tokens = load_tokens()
-    if token not in tokens:
-        return False, "Invalid token"
-    data = tokens[token]
-    if datetime.now() > datetime.fromisoformat(data['expires']):
-        del tokens[token]
-        save_tokens(tokens)
-        return False, "Token expired"
-    if data['used']:
-        return False, "Token already used"
-    return True, data
+    with _tokens_lock:
+        load_tokens()[token.bytes] = {
+            'created': now.isoformat(),
+            'expires': expires.isoformat(),
+            'expires_ts': expires_ts,
+            'description': description,
+            'used': False,
+            'filename': None
+        }
+        heapq.heappush(_expiry_heap, (expires_ts, token.bytes))
+    schedule_save(token.bytes)
+    return str(token), expires
+
+
+def use_token(token, claim=False):
+    """Check that a token can still be used and return (valid, data or error).
+
+    With claim=True a valid token is also reserved for the caller, in the
+    same locked step, so a concurrent upload with it fails as already used.
+    The caller must release_token() when done.
+    """
+    key = token_key(token)
+    with _tokens_lock:
+        tokens = load_tokens()
+        if key not in tokens:
+            return False, "Invalid token"
+        data = tokens[key]
+        if time.time() > data['expires_ts']:
+            del tokens[key]
+            schedule_save(key)
+            return False, "Token expired"
+        if data['used'] or key in _claimed:
+            return False, "Token already used"
+        if claim:
+            _claimed.add(key)
+        return True, data
+
+
+def release_token(token):
+    with _tokens_lock:
+        _claimed.discard(token_key(token))
 
 
 HTML_TEMPLATE = '''
@@ -364,13 +528,7 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
-
-@app.route('/upload/<token>', methods=['GET', 'POST'])
-def upload(token):
-    # Validate token
-    valid, data = use_token(token)
-    if not valid:
-        return render_template_string('''
+ERROR_HTML = '''
             <!DOCTYPE html>
             <html><head><title>Error</title>
             <style>
@@ -380,60 +538,198 @@ def upload(token):
                 p { color: #666; }
             </style>
             </head><body><div class="error"><h1>⚠️ Invalid Link</h1><p>This upload link is invalid or has expired.</p></div></body></html>
-        ''')
+        '''
+
+_ERROR_HTML_BYTES = ERROR_HTML.encode('utf-8')
+
+# The upload page only differs in its expiry timestamp. Everything before it
+# is gzipped once; each request resumes from a copy of that compressor state
+_PAGE_HEAD, _PAGE_TAIL = (part.encode('utf-8') for part in HTML_TEMPLATE.split('{{ expires_ts }}'))
+_page_gzip = zlib.compressobj(9, zlib.DEFLATED, 31)
+_PAGE_HEAD_GZ = _page_gzip.compress(_PAGE_HEAD) + _page_gzip.flush(zlib.Z_SYNC_FLUSH)
+
+
+def upload_page(expires_ts, gzipped=False):
+    """Return the upload page body for a token, optionally gzip-encoded"""
+    rest = str(expires_ts).encode('ascii') + _PAGE_TAIL
+    if not gzipped:
+        return _PAGE_HEAD + rest
+    compressor = _page_gzip.copy()
+    return _PAGE_HEAD_GZ + compressor.compress(rest) + compressor.flush()
+
+
+_UNSAFE_FILENAME_CHARS = str.maketrans({c: '_' for c in '/\\:*?"<>| \t\r\n\0'})
+
+
+def safe_filename(name):
+    """Make a client-supplied filename safe to create inside UPLOADS_DIR"""
+    name = name.translate(_UNSAFE_FILENAME_CHARS).lstrip('.')
+    if not name.isprintable():
+        # Other control characters: fall back to werkzeug's full scrub
+        name = secure_filename(name)
+    return name.encode('utf-8')[:MAX_FILENAME_BYTES].decode('utf-8', 'ignore')
+
+
+if StreamingFormDataParser is not None:
+    class UploadTarget(FileTarget):
+        """FileTarget that counts the bytes written and remembers whether
+        its part reached the closing boundary"""
+        complete = False
+        size = 0
+
+        def on_data_received(self, chunk):
+            super().on_data_received(chunk)
+            self.size += len(chunk)
+
+        def on_finish(self):
+            super().on_finish()
+            self.complete = True
+
+
+def stream_upload(path):
+    """Parse the multipart body as it arrives, writing the 'file' field to path.
+
+    Returns (client filename, bytes written); the filename is None if the
+    request has no file field. Raises ValueError if the body ends in the
+    middle of the file, and RequestEntityTooLarge past MAX_FILE_SIZE (older
+    Werkzeug releases don't enforce MAX_CONTENT_LENGTH on request.stream).
+    """
+    if (request.content_length or 0) > MAX_FILE_SIZE:
+        raise RequestEntityTooLarge()
+    target = UploadTarget(path)
+    parser = StreamingFormDataParser(headers=request.headers)
+    parser.register('file', target)
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.data_received(chunk)
+        if target.size > MAX_FILE_SIZE:
+            target.on_finish()  # close the partial file
+            raise RequestEntityTooLarge()
+    if target.multipart_filename is not None and not target.complete:
+        target.on_finish()  # close the partial file
+        raise ValueError("Upload ended before the closing boundary")
+    return target.multipart_filename, target.size
+
+
+@app.route('/upload/<token>', methods=['GET', 'POST'])
+def upload(token):
+    # Validate token, reserving it for the duration of an upload
+    valid, data = use_token(token, claim=request.method == 'POST')
+    if not valid:
+        return Response(_ERROR_HTML_BYTES, mimetype='text/html')
     
     if request.method == 'GET':
-        expires_ts = data.get('expires_ts', int(datetime.fromisoformat(data['expires']).timestamp()))
-        return render_template_string(HTML_TEMPLATE, expires=data['expires'], expires_ts=expires_ts)
-    
-    # POST - handle upload
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+        gzipped = request.accept_encodings['gzip'] > 0
+        response = Response(upload_page(data['expires_ts'], gzipped), mimetype='text/html')
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    try:
+        return save_upload(token, data)
+    finally:
+        release_token(token)
+
+
+def save_upload(token, data):
+    """Receive the POSTed file for a claimed token and mark the token used"""
+    if StreamingFormDataParser is not None:
+        # Stream straight to disk; the final name is only known once the part headers are read
+        partial = os.path.join(UPLOADS_DIR, f".{token_key(token).hex()}.part")
+        try:
+            original_name, size = stream_upload(partial)
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            if isinstance(e, (ParseFailedException, ValueError)):
+                return jsonify({'error': 'Malformed upload'}), 400
+            raise
+        if not original_name:
+            if os.path.exists(partial):
+                os.remove(partial)
+            error = 'No file provided' if original_name is None else 'No file selected'
+            return jsonify({'error': error}), 400
+    else:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        file = request.files['file']
+        original_name = file.filename
+        if original_name == '':
+            return jsonify({'error': 'No file selected'}), 400
     
     # Save file
-    filename = secure_filename(file.filename)
-    if not filename:
-        filename = f"upload_{int(time.time())}"
+    now = int(time.time())
+    filename = safe_filename(original_name) or f"upload_{now}"
     
     # Add timestamp to avoid conflicts
     name, ext = os.path.splitext(filename)
-    filename = f"{name}_{int(time.time())}{ext}"
+    filename = f"{name}_{now}{ext}"
     filepath = os.path.join(UPLOADS_DIR, filename)
     
-    file.save(filepath)
+    if StreamingFormDataParser is not None:
+        os.replace(partial, filepath)
+    else:
+        with open(filepath, 'wb') as f:
+            file.save(f, buffer_size=UPLOAD_CHUNK_SIZE)
+            size = f.tell()
     
     # Mark token as used
-    tokens = load_tokens()
-    tokens[token]['used'] = True
-    tokens[token]['filename'] = filename
-    tokens[token]['uploaded_at'] = datetime.now().isoformat()
-    tokens[token]['size'] = os.path.getsize(filepath)
-    save_tokens(tokens)
+    with _tokens_lock:
+        data['used'] = True
+        data['filename'] = filename
+        data['uploaded_at'] = datetime.now().isoformat()
+        data['size'] = size
+    schedule_save(token_key(token))
     
-    print(f"[{datetime.now().isoformat()}] File uploaded: {filename} ({os.path.getsize(filepath)} bytes)")
+    print(f"[{datetime.now().isoformat()}] File uploaded: {filename} ({size} bytes)")
     
     return jsonify({'success': True, 'filename': filename})
 
 
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'ok'})
+_HEALTH_BODY = b'{"status":"ok"}'
+_HEALTH_HEADERS = [('Content-Type', 'application/json'), ('Content-Length', str(len(_HEALTH_BODY)))]
+
+
+def health_shortcut(wsgi_app):
+    """Answer /health probes before Flask routes the request or builds a context"""
+    def app_with_health(environ, start_response):
+        method = environ.get('REQUEST_METHOD')
+        if environ.get('PATH_INFO') == '/health' and method in ('GET', 'HEAD'):
+            start_response('200 OK', list(_HEALTH_HEADERS))
+            return [] if method == 'HEAD' else [_HEALTH_BODY]
+        return wsgi_app(environ, start_response)
+    return app_with_health
+
+
+app.wsgi_app = health_shortcut(app.wsgi_app)
+
+
+def allow_api_request(addr):
+    """Take one token from addr's bucket; False if it is empty"""
+    now = time.monotonic()
+    with _api_buckets_lock:
+        last, tokens = _api_buckets.get(addr, (now, API_BURST))
+        tokens = min(API_BURST, tokens + (now - last) * API_RATE_LIMIT)
+        allowed = tokens >= 1
+        _api_buckets[addr] = (now, tokens - 1 if allowed else tokens)
+    return allowed
 
 
 @app.route('/api/create_token', methods=['POST'])
 def api_create_token():
     """Internal API for MCP server to create tokens"""
     # Simple auth via localhost only
-    if request.remote_addr not in ['127.0.0.1', '::1', '172.24.1.204']:
+    if request.remote_addr not in ALLOWED_API_ADDRS:
         return jsonify({'error': 'Unauthorized'}), 403
+    if not allow_api_request(request.remote_addr):
+        return jsonify({'error': 'Too many requests'}), 429
     
     description = request.json.get('description', '') if request.json else ''
     token, expires = create_token(description)
-    url = f"{DOMAIN}/upload/{token}"
+    url = UPLOAD_URL_PREFIX + token
     
     return jsonify({
         'token': token,
@@ -442,24 +738,29 @@ def api_create_token():
     })
 
 
+_INVALID_TOKEN_BODY = json_dumps({'exists': False, 'error': 'Invalid token'})
+
+
 @app.route('/api/check/<token>', methods=['GET'])
 def api_check(token):
     """Check if token has been used"""
-    if request.remote_addr not in ['127.0.0.1', '::1', '172.24.1.204']:
+    if request.remote_addr not in ALLOWED_API_ADDRS:
         return jsonify({'error': 'Unauthorized'}), 403
+    if not allow_api_request(request.remote_addr):
+        return jsonify({'error': 'Too many requests'}), 429
     
-    tokens = load_tokens()
-    if token not in tokens:
-        return jsonify({'exists': False, 'error': 'Invalid token'})
+    data = get_token(token)
+    if data is None:
+        return Response(_INVALID_TOKEN_BODY, mimetype='application/json')
     
-    data = tokens[token]
-    return jsonify({
+    # Polled by the MCP server, so skip jsonify and dump the dict directly
+    return Response(json_dumps({
         'exists': True,
         'used': data['used'],
         'filename': data.get('filename'),
         'expires': data['expires'],
-        'expired': datetime.now() > datetime.fromisoformat(data['expires'])
-    })
+        'expired': time.time() > data['expires_ts']
+    }), mimetype='application/json')
 
 
 if __name__ == '__main__':
@@ -467,4 +768,12 @@ if __name__ == '__main__':
     print(f"Domain: {DOMAIN}")
     print(f"Uploads directory: {UPLOADS_DIR}")
     print(f"Token TTL: {TOKEN_TTL_MINUTES} minutes")
-    app.run(host=HOST, port=PORT, debug=False)
+    # Exit normally on SIGTERM so the atexit hook saves pending tokens
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Tokens, upload claims and rate-limit buckets live in this process's
+    # memory, so scale with threads rather than extra worker processes;
+    # the upload path spends most of its time in socket and disk I/O
+    if serve is not None:
+        serve(app, host=HOST, port=PORT, threads=SERVER_THREADS)
+    else:
+        app.run(host=HOST, port=PORT, debug=False, threaded=True)